@@ -3,18 +3,91 @@ import os
 import sys
 import glob
 import re
+import shutil
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from datetime import datetime
+from functools import lru_cache
+from itertools import chain, islice
+
+try:
+    import ijson  # optional: stream conversations.json instead of loading it whole
+except ImportError:
+    ijson = None
+
+try:
+    import orjson  # optional: faster parsing when a file is loaded whole
+except ImportError:
+    orjson = None
+
+
+_LATEX_RE = re.compile(r'\\\((.+?)\\\)|\\\[(.+?)\\\]', re.DOTALL)
+_BACKTICK_RE = re.compile(r'`+')
+_ASSET_POINTER_RE = re.compile(r'file-service://(file-[a-zA-Z0-9]+)|sediment://(file_[a-f0-9]+)')
+_FILE_ID_RE = re.compile(r'file[-_][a-zA-Z0-9]+')
+
+_NEG_INF = float('-inf')
+
+# Below this many conversations, worker process startup outweighs the parallel speedup
+_PARALLEL_MIN_CONVERSATIONS = 100
+
+# Threads per conversation used to copy images while markdown is generated
+_IMAGE_COPY_WORKERS = 8
+
+# conversations.json files at least this large are streamed instead of loaded whole
+_STREAM_THRESHOLD_BYTES = 64 * 1024 * 1024
+
+# Deletes every ASCII character that is not allowed in an output filename
+_ASCII_FILENAME_TABLE = {
+    i: None for i in range(128) if not (chr(i).isalnum() or chr(i) in (' ', '_'))
+}
+
+
+if os.sep == '/':
+    def join_path(folder, name):
+        """Join a folder and a plain file name; cheaper than os.path.join on POSIX."""
+        return f"{folder}/{name}"
+else:
+    join_path = os.path.join
 
 
 def read_json_file(file_path):
     """Read and return JSON content from a file."""
+    if orjson is not None:
+        with open(file_path, 'rb') as file:
+            raw = file.read()
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            # orjson is stricter than json (e.g. lone surrogate escapes), so retry with json
+            return json.loads(raw.decode('utf-8'))
+
     with open(file_path, 'r', encoding='utf-8') as file:
         return json.load(file)
 
 
+def iter_conversations(file_path):
+    """Yield conversation entries from conversations.json one at a time.
+
+    Exports larger than _STREAM_THRESHOLD_BYTES are streamed with ijson when it is
+    installed, so only one conversation is held in memory; smaller exports (or
+    no ijson) are loaded whole, which is faster when the file fits comfortably.
+    """
+    if ijson is None or os.path.getsize(file_path) < _STREAM_THRESHOLD_BYTES:
+        yield from read_json_file(file_path)
+        return
+
+    with open(file_path, 'rb') as file:
+        yield from ijson.items(file, 'item', use_float=True)
+
+
+def create_time_key(message):
+    """Sort key for messages: create_time, with untimestamped messages first."""
+    return message.get("create_time") or _NEG_INF
+
+
 def get_message_content(message):
     """Return a list of content parts from a message: either strings or image dicts."""
-    content = message.get("content", {})
+    content = message.get("content") or {}
     parts = []
 
     if "parts" in content:
@@ -38,184 +111,301 @@ def infer_title(title, first_message):
     if title:
         return title
 
-    parts = get_message_content(first_message)
+    try:
+        parts = get_message_content(first_message)
+    except ValueError:
+        return "Untitled"
+
     for part in parts:
         if "text" in part:
-            first_line = part["text"].strip().split("\n", 1)[0]
+            first_line = part["text"].strip().partition("\n")[0]
             return first_line + "..."
 
     return "Untitled"
 
 
 
+@lru_cache(maxsize=None)
+def index_image_files(folder):
+    """Map each file id in a folder (e.g. file-XYZ) to the first file name starting with it.
+
+    Cached so each folder is listed only once per process.
+    """
+    index = {}
+    for name in os.listdir(folder):
+        match = _FILE_ID_RE.match(name)
+        if match:
+            index.setdefault(match.group(0), name)
+    return index
+
+
 def get_backtick_wrapper(content):
     """Return a safe backtick sequence to wrap code blocks containing backticks."""
-    backticks = re.findall(r'`+', content)
-    max_len = max((len(b) for b in backticks), default=2)
+    if '`' not in content:
+        return '```'
+    max_len = max(m.end() - m.start() for m in _BACKTICK_RE.finditer(content))
     return '`' * (max_len + 1)
 
 
+@lru_cache(maxsize=4096)
 def sanitize_filename(name):
     """Remove illegal characters from a filename."""
-    return ''.join(c for c in name if c.isalnum() or c in (' ', '_')).rstrip().replace(' ', '_')
+    if name.isascii():
+        kept = name.translate(_ASCII_FILENAME_TABLE)
+    else:
+        kept = ''.join(c for c in name if c.isalnum() or c in (' ', '_'))
+    return kept.rstrip().replace(' ', '_')
+
+
+def _latex_replacement(match):
+    """Render one _LATEX_RE match as $inline$ or $$display$$ math."""
+    inline = match.group(1)
+    return f'${inline}$' if inline is not None else f'$${match.group(2)}$$'
+
 
 def convert_latex(content):
     """Convert LaTeX delimiters: \( \) → $ $, \[ \] → $$ $$"""
-    content = re.sub(r'\\\((.+?)\\\)', r'$\1$', content, flags=re.DOTALL)
-    content = re.sub(r'\\\[(.+?)\\\]', r'$$\1$$', content, flags=re.DOTALL)
-    return content
+    return _LATEX_RE.sub(_latex_replacement, content)
 
 
-def process_conversations(data, output_dir, config):
-    """Convert a list of conversation entries into formatted markdown files."""
-    for entry in data:
-        if not isinstance(entry, dict):
-            print(f"Skipping entry (not a dict): {entry}")
-            continue
+def prepare_conversation(entry, config):
+    """Return (messages, title, first timestamped message, base filename) for an entry, or None to skip it."""
+    if not isinstance(entry, dict):
+        print(f"Skipping entry (not a dict): {entry}")
+        return None
 
-        
-        mapping = entry.get("mapping", {})
-        messages = [
-            item["message"] for item in mapping.values()
-            if isinstance(item, dict) and isinstance(item.get("message"), dict)
-        ]
+    mapping = entry.get("mapping", {})
+    messages = [
+        item["message"] for item in mapping.values()
+        if isinstance(item, dict) and isinstance(item.get("message"), dict)
+    ]
 
-        messages.sort(key=lambda m: m.get("create_time") or float('-inf'))
+    messages.sort(key=create_time_key)
 
-        if not messages:
-            print("Skipping conversation with no messages.")
-            continue
+    if not messages:
+        print("Skipping conversation with no messages.")
+        return None
+
+    inferred_title = infer_title(entry.get("title"), messages[0])
+    sanitized_title = sanitize_filename(inferred_title)
+
+    first_timestamped = next((m for m in messages if m.get("create_time")), None)
+
+    # Optional date prefix
+    if config.get("prefix_date_in_filename") and first_timestamped:
+        date_prefix = datetime.fromtimestamp(first_timestamped["create_time"]).strftime("%Y-%m-%d")
+        filename = f"{date_prefix}_{sanitized_title}"
+    else:
+        filename = sanitized_title
+
+    return messages, inferred_title, first_timestamped, filename
+
+
+def unique_filename(filename, used_names):
+    """Return filename, or filename_2, filename_3, ... if it is already in used_names.
+
+    Names are compared case-insensitively, since Windows and macOS filesystems are.
+    """
+    candidate = filename
+    counter = 2
+    while candidate.casefold() in used_names:
+        candidate = f"{filename}_{counter}"
+        counter += 1
+    used_names.add(candidate.casefold())
+    return candidate
+
+
+def process_conversation(messages, inferred_title, first_timestamped, filename, output_dir, config):
+    """Convert a single prepared conversation into a formatted markdown file."""
+    file_path = os.path.join(output_dir, f"{filename}.md")
+
+    buf = []
+    w = buf.append
+
+    if config.get("obsidian_front_matter", False):
+        w("---\n")
+        w(f"title: {inferred_title}\n")
+        if first_timestamped:
+            date_str = datetime.fromtimestamp(first_timestamped["create_time"]).strftime(config["date_format"])
+            w(f"date: {date_str}\n")
+        w("---\n\n")
         
-        inferred_title = infer_title(entry.get("title"), messages[0])
-        sanitized_title = sanitize_filename(inferred_title)
-
-        first_timestamped = next((m for m in messages if m.get("create_time")), None)
-
-        # Optional date prefix
-        if config.get("prefix_date_in_filename") and first_timestamped:
-            date_prefix = datetime.fromtimestamp(first_timestamped["create_time"]).strftime("%Y-%m-%d")
-            filename = f"{date_prefix}_{sanitized_title}"
-        else:
-            filename = sanitized_title
-
-        file_path = os.path.join(output_dir, f"{filename}.md")
-
-        with open(file_path, "w", encoding="utf-8") as f:
-            first_timestamped = next((m for m in messages if m.get("create_time")), None)                
-                
-            if config.get("obsidian_front_matter", False):
-                f.write("---\n")
-                f.write(f"title: {inferred_title}\n")
-                if first_timestamped:
-                    date_str = datetime.fromtimestamp(first_timestamped["create_time"]).strftime(config["date_format"])
-                    f.write(f"date: {date_str}\n")
-                f.write("---\n\n")
-                
-
-            image_counter = 1  # Keep track of image number per file
-
-            for message in messages:
-                role = message.get("author", {}).get("role", "unknown")
+
+    image_counter = 1  # Keep track of image number per file
+    image_copies = []  # Pending image copy futures for this file
+
+    # Bind per-message settings to locals once instead of looking them up for every message
+    include_timestamps = config.get("include_timestamps")
+    time_format = config.get("time_format")
+    skip_empty = config.get("skip_empty_messages")
+    convert_latex_syntax = config.get("convert_latex_syntax")
+    collapse_long = config.get("collapse_long_messages")
+    line_threshold = config.get("long_message_line_threshold", 5)
+    open_attr = " open" if config.get("collapse_open_by_default") else ""
+    input_directory = config["input_directory"]
+    user_name = config["user_name"]
+    llm_name = config["LLM_name"]
+    separator = config["message_separator"]
+
+    # Threads are only started on the first image, and leaving the block waits for
+    # every copy; the pool is never shared, so it cannot be inherited across a fork
+    with ThreadPoolExecutor(max_workers=_IMAGE_COPY_WORKERS) as copy_pool:
+        for message in messages:
+            role = message.get("author", {}).get("role", "unknown")
+            author = user_name if role == "user" else llm_name
+            raw_content = message.get("content") or {}
+            if raw_content.get("parts") or "text" in raw_content or "result" in raw_content:
                 content_parts = get_message_content(message)
-                content = ""
-                
-                if config.get("include_timestamps") and message.get("create_time"):
-                    timestamp = datetime.fromtimestamp(message["create_time"]).strftime(config["time_format"])
-                    f.write(f"<sub>{timestamp}</sub>\n")
-
-                for part in content_parts:
-                    # If it's an image
-                    if part.get("content_type") == "image_asset_pointer":
-                        asset_pointer = part.get("asset_pointer", "")
-                        file_id = None
-
-                        # Match file-service://file-XYZ
-                        if asset_pointer.startswith("file-service://"):
-                            match = re.search(r'file-service://(file-[a-zA-Z0-9]+)', asset_pointer)
-                            if match:
-                                file_id = match.group(1)
-
-                        # Match sediment://file_ABC
-                        elif asset_pointer.startswith("sediment://"):
-                            match = re.search(r'sediment://(file_[a-f0-9]+)', asset_pointer)
-                            if match:
-                                file_id = match.group(1)
-                        if match:                           
-                            # Default to normal input_directory
-                            input_folder = config["input_directory"]
-                            
-                            # Special handling for dalle-generated images
-                            if message.get("author", {}).get("role") == "tool" and message.get("author", {}).get("name") == "dalle.text2im":
-                                input_folder = os.path.join(input_folder, "dalle-generations")
-
-                            image_files = [f for f in os.listdir(input_folder) if f.startswith(file_id)]
-
-                            if image_files:
-                                original_image_path = os.path.join(input_folder, image_files[0])
-                                image_ext = os.path.splitext(image_files[0])[1]
-                                new_image_filename = f"{filename}_image_{image_counter}{image_ext}"
-                                new_image_path = os.path.join(output_dir, new_image_filename)
-
-                                # Copy image file
-                                with open(original_image_path, 'rb') as src, open(new_image_path, 'wb') as dst:
-                                    dst.write(src.read())
-
-                                # Optional: include prompt if dalle metadata is present
-                                metadata = part.get("metadata")
-                                dalle_prompt = ""
-                                if isinstance(metadata, dict):
-                                    dalle_info = metadata.get("dalle")
-                                    if isinstance(dalle_info, dict):
-                                        dalle_prompt = dalle_info.get("prompt", "")
-
-                                if dalle_prompt:
-                                    f.write(f"**{author} (DALL·E)**: *{dalle_prompt}*\n")
-
-                                image_code = f'\n<img src="{new_image_filename}" alt="Generated image" width="400">\n\n'
-                                f.write(f"{image_code}")
-                                image_counter += 1
-                            else:
-                                print(f"Image file not found for file_id: {file_id}")
-
-
-                    else:
-                        text = part.get("text", "")
-                        content += text + "\n"
-
-
-                if config.get("skip_empty_messages") and not content:
-                    continue
-
-                author = config["user_name"] if role == "user" else config["LLM_name"]
-
-                
-
-
-                use_code_block = role == "user" or '```' in content
-                if config.get("convert_latex_syntax"):
-                    content = convert_latex(content)
-
-                num_lines = len(content.splitlines())
-                collapse = config.get("collapse_long_messages") and num_lines > config.get("long_message_line_threshold", 5)
-
-                if collapse:
-                    open_attr = " open" if config.get("collapse_open_by_default") else ""
-                    f.write(f"**{author}**:\n\n<details{open_attr}><summary>Long Message with {num_lines} lines</summary>\n\n")
-
-                if use_code_block:
-                    wrapper = get_backtick_wrapper(content)
-                    f.write(f"{wrapper}\n{content}\n{wrapper}")
+            else:
+                content_parts = []  # nothing to render; skip_empty_messages drops it below
+            text_chunks = []
+        
+            if include_timestamps and message.get("create_time"):
+                timestamp = datetime.fromtimestamp(message["create_time"]).strftime(time_format)
+                w(f"<sub>{timestamp}</sub>\n")
+
+            for part in content_parts:
+                # If it's an image
+                if part.get("content_type") == "image_asset_pointer":
+                    asset_pointer = part.get("asset_pointer", "")
+
+                    # Match file-service://file-XYZ or sediment://file_ABC
+                    match = _ASSET_POINTER_RE.match(asset_pointer)
+                    if match:
+                        file_id = match.group(1) or match.group(2)
+
+                        # Default to normal input_directory
+                        input_folder = input_directory
+                    
+                        # Special handling for dalle-generated images
+                        if message.get("author", {}).get("role") == "tool" and message.get("author", {}).get("name") == "dalle.text2im":
+                            input_folder = join_path(input_folder, "dalle-generations")
+
+                        image_file = index_image_files(input_folder).get(file_id)
+
+                        if image_file:
+                            original_image_path = join_path(input_folder, image_file)
+                            image_ext = os.path.splitext(image_file)[1]
+                            new_image_filename = f"{filename}_image_{image_counter}{image_ext}"
+                            new_image_path = join_path(output_dir, new_image_filename)
+
+                            # Copy image file in the background while the markdown is built.
+                            # The target is unique: filename is unique per run and image_counter per file.
+                            image_copies.append(
+                                copy_pool.submit(shutil.copyfile, original_image_path, new_image_path)
+                            )
+
+                            # Optional: include prompt if dalle metadata is present
+                            metadata = part.get("metadata")
+                            dalle_prompt = ""
+                            if isinstance(metadata, dict):
+                                dalle_info = metadata.get("dalle")
+                                if isinstance(dalle_info, dict):
+                                    dalle_prompt = dalle_info.get("prompt", "")
+
+                            if dalle_prompt:
+                                w(f"**{author} (DALL·E)**: *{dalle_prompt}*\n")
+
+                            image_code = f'\n<img src="{new_image_filename}" alt="Generated image" width="400">\n\n'
+                            w(f"{image_code}")
+                            image_counter += 1
+                        else:
+                            print(f"Image file not found for file_id: {file_id}")
+
+
                 else:
-                    f.write(f"{content}")
+                    text_chunks.append(part.get("text", ""))
+                    text_chunks.append("\n")
+
+            content = "".join(text_chunks)
 
-                if collapse:
-                    f.write("\n\n</details>")
+            if skip_empty and not content:
+                continue
 
-                f.write(config['message_separator'])
 
-                if collapse:
-                    f.write("\n\n")
+            use_code_block = role == "user" or '```' in content
+            if convert_latex_syntax:
+                content = convert_latex(content)
 
+            num_lines = content.count('\n') + (0 if content.endswith('\n') or not content else 1)
+            collapse = collapse_long and num_lines > line_threshold
+
+            if collapse:
+                w(f"**{author}**:\n\n<details{open_attr}><summary>Long Message with {num_lines} lines</summary>\n\n")
+
+            if use_code_block:
+                wrapper = get_backtick_wrapper(content)
+                w(f"{wrapper}\n{content}\n{wrapper}")
+            else:
+                w(f"{content}")
+
+            if collapse:
+                w("\n\n</details>")
+
+            w(separator)
+
+            if collapse:
+                w("\n\n")
+
+    for future in image_copies:
+        future.result()
+
+    # Encode once and write bytes, skipping the text layer's incremental encoder
+    markdown = ''.join(buf)
+    if os.linesep != '\n':
+        markdown = markdown.replace('\n', os.linesep)  # same line endings as text mode
+    with open(file_path, "wb") as f:
+        f.write(markdown.encode("utf-8"))
+
+
+def prepared_conversations(data, config):
+    """Yield (messages, title, first timestamped message, unique filename) for each usable entry.
+
+    Filenames are assigned in input order: conversations that share a name
+    (e.g. several "New chat" on one day) get a numeric suffix, so no two
+    conversations ever write the same files.
+    """
+    used_names = set()
+    for entry in data:
+        prepared = prepare_conversation(entry, config)
+        if prepared is None:
+            continue
+        messages, inferred_title, first_timestamped, filename = prepared
+        yield messages, inferred_title, first_timestamped, unique_filename(filename, used_names)
+
+
+def process_conversations(data, output_dir, config):
+    """Convert an iterable of conversation entries into formatted markdown files.
+
+    Conversations are independent, so they are converted in parallel worker
+    processes. Entries are submitted lazily with a bounded number in flight,
+    so a streamed input is never read ahead much further than the workers.
+    With a single CPU, or fewer than _PARALLEL_MIN_CONVERSATIONS conversations,
+    starting workers costs more than it saves, so they are converted in-process.
+    """
+    # Windows' ProcessPoolExecutor rejects more than 61 workers
+    max_workers = min(os.cpu_count() or 1, 61)
+    max_pending = max_workers * 4
+
+    conversations = prepared_conversations(data, config)
+    head = [] if max_workers == 1 else list(islice(conversations, _PARALLEL_MIN_CONVERSATIONS))
+
+    if max_workers == 1 or len(head) < _PARALLEL_MIN_CONVERSATIONS:
+        for conversation in chain(head, conversations):
+            process_conversation(*conversation, output_dir, config)
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        for conversation in chain(head, conversations):
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            pending.add(executor.submit(process_conversation, *conversation, output_dir, config))
+
+        for future in pending:
+            future.result()
 
 
 def main():
@@ -229,8 +419,7 @@ def main():
 
     json_file = conversations_file
     print(f"Processing: {json_file}")
-    data = read_json_file(json_file)
-    process_conversations(data, output_dir, config)
+    process_conversations(iter_conversations(json_file), output_dir, config)
 
     print(f"\n✅ All Done! Your files are ready in: {output_dir}")
 